@@ -2,9 +2,42 @@
 class Config:
     LLM_MODEL_NAME = "gemma3:27b"
     LLM_API_BASE_URL = "http://10.5.61.81:11437"
+    LLM_API_BASE_URLS = [LLM_API_BASE_URL]  # 可加入多台 Ollama 主機，依負載分派並自動切換
+    LLM_REQUEST_TIMEOUT = 600  # 單次 LLM 請求逾時秒數，逾時即改送其他主機
+    LLM_BACKEND_COOLDOWN = 30  # 主機失敗後暫停分派的秒數
     BACKGROUND_IMAGE_PATH = "bg.png"
     OUTPUT_FOLDER = "summaries"
+    CHECKPOINT_FOLDER = "checkpoints"  # 長音檔轉錄進度存檔，中斷後可接續
+    CHECKPOINT_MAX_AGE_DAYS = 7  # 未再重試的轉錄進度存檔保留天數
+    FINGERPRINT_DB_PATH = "fingerprints/index.db"  # 聲紋索引，重新編碼的同一份錄音可沿用逐字稿
     DEFAULT_USER_ID = "guest"
     DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
     AUDIO_MODEL_TYPE = "medium"
-    # MODEL: tiny, base, small,medium, (large, turbo)
\ No newline at end of file
+    # MODEL: tiny, base, small,medium, (large, turbo)
+    PRELOAD_MODELS_AFTER_LOGIN = True  # 登入後於背景執行緒預載 Whisper 與 LLM 模組
+    WHISPER_MAX_CONCURRENT_JOBS = 1  # 同時執行的轉錄數，其餘依使用者輪流排隊；每多一筆即多載入一個 Whisper 模型（見 README）
+    WHISPER_THREADS_PER_JOB = None  # 每筆轉錄使用的 torch 執行緒數（None：依執行中的轉錄數平均分配 CPU 核心）
+    WHISPER_WINDOW_SECONDS = 300  # 逐段轉錄的音訊長度上限（秒），在前一句結尾切段，可在段與段之間取消與排隊
+    WHISPER_INITIAL_SPEED = 0.5  # 處理 1 秒音訊所需秒數的初始估計（之後依實際速度調整）
+
+    # 🔹 摘要合併設定（map-reduce）
+    SUMMARY_REDUCE_MODE = "tree"  # flat：直接串接各段摘要；tree：逐層合併為單一會議記錄
+    SUMMARY_REDUCE_FAN_IN = 4  # 每次合併的部分摘要數量上限
+    SUMMARY_REDUCE_MAX_DEPTH = 4  # 最多合併層數，超過則直接串接剩餘摘要
+    SUMMARY_REDUCE_MAX_TOKENS = 7000  # 每次合併的輸入長度上限（與 split_text 相同以字元數估算）
+    SUMMARY_MAX_WORKERS = 4  # 同一層可平行呼叫 LLM 的數量
+    PIPELINE_AUDIO_SUMMARY = True  # 音檔生成摘要時邊轉錄邊摘要（轉錄完成的分段立即送 LLM）
+    PIPELINE_QUEUE_SIZE = 8  # 轉錄端與摘要端之間的佇列上限（以音訊區段計）
+
+    # 🔹 VTT 逐字稿前處理
+    TRANSCRIPT_DROP_FILLERS = False  # 上傳 VTT 時是否刪除語助詞
+    TRANSCRIPT_FILLER_WORDS = ["嗯", "呃", "欸", "um", "uh", "erm", "hmm"]
+
+    # 🔹 聲紋比對（辨識重新上傳的同一份錄音）
+    FINGERPRINT_ENABLED = True
+    FINGERPRINT_QUERY_HASHES = 20000  # 比對時最多使用的雜湊數
+    FINGERPRINT_MIN_MATCHES = 50  # 同一位移至少吻合的雜湊數
+    FINGERPRINT_MATCH_RATIO = 0.1  # 吻合雜湊佔查詢雜湊的比例下限
+    FINGERPRINT_DURATION_TOLERANCE = 3.0  # 既有錄音可超出本次音檔的秒數（本次多出的開頭或結尾會另行轉錄）
+    FINGERPRINT_MAX_AGE_DAYS = 30  # 索引中錄音與逐字稿的保留天數，逾期自動刪除
+    FINGERPRINT_SHARE_ACROSS_USERS = False  # 是否沿用其他使用者上傳的相同錄音逐字稿（不顯示對方檔名）
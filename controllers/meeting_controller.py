@@ -1,7 +1,10 @@
 import streamlit as st
 from models.audio_transcriber import AudioTranscriber
 from models.llm_summarizer import LLMTextSummarizer
+from models.llm_router import LLMUnavailableError
 from models.document_generator import DocumentGenerator
+from models.cancellation import CancellationToken, JobCancelledError
+from models.summary_pipeline import SummaryPipeline
 from config import Config
 import base64
 
@@ -27,21 +30,72 @@ class MeetingSummaryApp:
         if not (uploaded_file and is_submitted):
             return
 
-        if selected_mode == "audio_transcription":
-            self._handle_transcription(uploaded_file)
-        elif selected_mode == "vtt_summary":
-            extracted_text = DocumentGenerator.extract_VTT(uploaded_file.getvalue())
-            if extracted_text:  # 確保 VTT 內容不為空
-                self._handle_summary(extracted_text, summary_prompt, uploaded_file)
-            else:
-                st.error("⚠️ VTT 解析失敗，請上傳有效的逐字稿檔案")
-        elif selected_mode == "audio_summary":
-            transcript_text = self._handle_transcription(uploaded_file) or ""  # 確保轉錄內容不為 None
-            clean_text = DocumentGenerator.clean_text(transcript_text)
-            if clean_text.strip():  # 避免處理空白內容
-                self._handle_summary(transcript_text.strip(), summary_prompt, uploaded_file)
-            else:
-                st.error("⚠️ 轉錄內容為空，無法生成摘要")
+        cancel_token = self.start_job()
+        try:
+            if selected_mode == "audio_transcription":
+                self._handle_transcription(uploaded_file, cancel_token)
+            elif selected_mode == "vtt_summary":
+                extracted_text, stats = DocumentGenerator.preprocess_VTT(uploaded_file.getvalue())
+                if extracted_text:  # 確保 VTT 內容不為空
+                    st.caption(
+                        f"🔻 {uploaded_file.name}：Token 約 {stats['tokens_before']:,} → {stats['tokens_after']:,}"
+                        f"（減少 {stats['reduction']:.0%}）"
+                    )
+                    self._handle_summary(extracted_text, summary_prompt, uploaded_file, cancel_token)
+                else:
+                    st.error("⚠️ VTT 解析失敗，請上傳有效的逐字稿檔案")
+            elif selected_mode == "audio_summary" and Config.PIPELINE_AUDIO_SUMMARY:
+                self._handle_pipelined_summary(uploaded_file, summary_prompt, cancel_token)
+            elif selected_mode == "audio_summary":
+                transcript_text = self._handle_transcription(uploaded_file, cancel_token) or ""  # 確保轉錄內容不為 None
+                clean_text = DocumentGenerator.clean_text(transcript_text)
+                if clean_text.strip():  # 避免處理空白內容
+                    self._handle_summary(transcript_text.strip(), summary_prompt, uploaded_file, cancel_token)
+                else:
+                    st.error("⚠️ 轉錄內容為空，無法生成摘要")
+        except JobCancelledError:
+            st.warning("⏹️ 已停止執行")
+        except LLMUnavailableError as error:
+            st.error(f"⚠️ 摘要生成失敗：LLM 服務暫時無法使用，請稍後再試（{error}）")
+            self.show_backend_status()
+        finally:
+            # 無論正常結束、按下停止、重新送出或關閉頁面（Streamlit 中止腳本），
+            # 都取消尚未完成的 ffmpeg 與 LLM 請求，釋放資源給下一個工作
+            cancel_token.cancel()
+
+    @staticmethod
+    def start_job():
+        """
+        建立新工作的取消權杖，並取消同一 session 中仍在執行的舊工作
+
+        停止按鈕的回呼要等到腳本下一次執行才會被呼叫；長時間等待時權杖會定期更新隱藏的 placeholder，
+        Streamlit 藉此處理停止、重新執行或關閉頁面並中止腳本，run() 的 finally 隨即取消工作
+        """
+        previous_token = st.session_state.get("cancel_token")
+        if previous_token is not None:
+            previous_token.cancel()
+        heartbeat = st.empty()
+        cancel_token = CancellationToken(heartbeat=heartbeat.empty)
+        st.session_state["cancel_token"] = cancel_token
+        return cancel_token
+
+    @staticmethod
+    def cancel_job():
+        """停止按鈕的回呼：取消目前的工作"""
+        cancel_token = st.session_state.get("cancel_token")
+        if cancel_token is not None:
+            cancel_token.cancel()
+
+    @staticmethod
+    def show_backend_status():
+        """顯示各 LLM 後端主機的健康狀態與負載"""
+        for backend in LLMTextSummarizer.backend_stats():
+            state = "✅ 正常" if backend["healthy"] else "⛔ 暫停分派"
+            latency = f"{backend['avg_latency']:.1f} 秒" if backend["avg_latency"] is not None else "—"
+            st.caption(
+                f"{backend['base_url']}：{state}，進行中 {backend['in_flight']}，"
+                f"成功 {backend['requests']} / 失敗 {backend['failures']}，平均回應 {latency}"
+            )
 
     @staticmethod
     def load_base64_image(path):
@@ -129,6 +183,7 @@ class MeetingSummaryApp:
 
         # 按鈕
         submitted = st.sidebar.button("開始執行")
+        st.sidebar.button("⏹️ 停止執行", on_click=self.cancel_job)
 
         # ✅ 按下按鈕時，更新預設提示語
         if submitted:
@@ -136,7 +191,7 @@ class MeetingSummaryApp:
 
         return selected_key, uploaded_file, prompt, submitted
 
-    def _handle_transcription(self, uploaded_file):
+    def _handle_transcription(self, uploaded_file, cancel_token=None, on_segments=None):
         """處理音檔轉逐字稿"""
         if uploaded_file is None:
             st.warning("⚠️ 請上傳音檔")
@@ -144,7 +199,8 @@ class MeetingSummaryApp:
 
         with st.spinner("音訊轉錄中..."):  # 顯示等待提示
             audio_transcriber = AudioTranscriber()
-            transcription = audio_transcriber.transcribe(uploaded_file)
+            user_id = st.session_state.get("user_id", Config.DEFAULT_USER_ID)
+            transcription = audio_transcriber.transcribe(uploaded_file, user_id, cancel_token, on_segments)
 
         if transcription:
             st.subheader("📝 逐字稿")
@@ -164,10 +220,45 @@ class MeetingSummaryApp:
             return ""
 
     # 摘要生成處理
-    def _handle_summary(self, text, prompt, uploaded_file):
+    def _handle_summary(self, text, prompt, uploaded_file, cancel_token=None):
         with st.spinner("摘要生成中..."):  # 顯示等待提示
             chunks = DocumentGenerator.split_text(text)  # 將文本切塊
-            summary = LLMTextSummarizer.summary_generator(chunks, prompt)  # 生成摘要
+            progress = st.progress(0.0, text="摘要生成中...")
+
+            def show_progress(stage, done, total):
+                progress.progress(done / total, text=f"{stage}（{done}/{total}）")
+
+            summary = LLMTextSummarizer.summary_generator(
+                chunks, prompt, cancel_token=cancel_token, on_progress=show_progress
+            )  # 生成摘要
+            progress.empty()
+        self._show_summary(summary, prompt, uploaded_file)
+
+    # 邊轉錄邊摘要：每完成一個音訊區段就送入管線，分段湊滿即送 LLM
+    def _handle_pipelined_summary(self, uploaded_file, prompt, cancel_token):
+        pipeline = SummaryPipeline(prompt, cancel_token)
+        pipeline.feed(AudioTranscriber.VTT_HEADER)  # 與完整逐字稿的切分結果一致
+
+        transcript_text = self._handle_transcription(
+            uploaded_file, cancel_token,
+            on_segments=lambda segments: pipeline.feed("\n".join(AudioTranscriber.format_vtt_cues(segments)))
+        )
+        if not DocumentGenerator.clean_text(transcript_text or "").strip():
+            st.error("⚠️ 轉錄內容為空，無法生成摘要")
+            return
+
+        with st.spinner("摘要生成中..."):  # 轉錄期間已送出的分段摘要，此時多半已完成
+            progress = st.progress(0.0, text="摘要生成中...")
+
+            def show_progress(stage, done, total):
+                progress.progress(done / total, text=f"{stage}（{done}/{total}）")
+
+            summary = pipeline.close(on_progress=show_progress)
+            progress.empty()
+        self._show_summary(summary, prompt, uploaded_file)
+
+    def _show_summary(self, summary, prompt, uploaded_file):
+        """顯示摘要結果並提供下載"""
         if summary:
             st.subheader("📄 摘要結果")
             st.write(summary)  # 顯示摘要內容
@@ -0,0 +1,257 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from config import Config
+
+
+# 🔹 **聲紋指紋**
+class AudioFingerprint:
+    """
+    由 16kHz PCM 計算精簡的聲紋指紋（頻譜峰值配對雜湊）
+    - 降採樣至 8kHz 後做短時傅立葉轉換，各頻帶取時間上的局部最大值作為峰值
+    - 每個峰值與之後數個峰值配對，(頻率1, 頻率2, 時間差) 組成雜湊，並記錄發生的影格
+    - 峰值位置不受容器、位元率與重新編碼影響，時間差也不受整體時間位移影響
+    """
+
+    FRAME_SIZE = 512        # 8kHz 下 64ms
+    HOP_SIZE = 256          # 每影格 32ms
+    BLOCK_FRAMES = 8192     # 分批計算頻譜，限制記憶體用量
+    BANDS = [(4, 16), (16, 32), (32, 64), (64, 128), (128, 256)]  # 約 60Hz ~ 4kHz
+    PEAK_NEIGHBORHOOD = 10  # 前後各 10 影格內的最大值才算峰值
+    FAN_OUT = 3             # 每個峰值配對的後續峰值數
+    MAX_DELTA = 63          # 配對峰值的最大時間差（影格，6 bits）
+
+    @staticmethod
+    def frames_per_second():
+        return 8000 / AudioFingerprint.HOP_SIZE
+
+    @staticmethod
+    def compute(audio):
+        """
+        計算聲紋指紋
+
+        參數:
+        - audio: 16kHz 單聲道 float32 波形（numpy 陣列）
+
+        回傳:
+        - [(雜湊值, 影格位置)] 列表
+        """
+        import numpy as np
+
+        # 降採樣至 8kHz（兩點平均），會議語音的能量主要在 4kHz 以下
+        samples = audio[:len(audio) // 2 * 2].reshape(-1, 2).mean(axis=1)
+        frame_size, hop = AudioFingerprint.FRAME_SIZE, AudioFingerprint.HOP_SIZE
+        if len(samples) < frame_size:
+            return []
+
+        n_frames = 1 + (len(samples) - frame_size) // hop
+        window = np.hanning(frame_size).astype(np.float32)
+        band_energy = np.zeros((len(AudioFingerprint.BANDS), n_frames), dtype=np.float32)
+        band_bin = np.zeros((len(AudioFingerprint.BANDS), n_frames), dtype=np.int16)
+
+        # 各影格、各頻帶的最強頻率與能量
+        for start in range(0, n_frames, AudioFingerprint.BLOCK_FRAMES):
+            count = min(AudioFingerprint.BLOCK_FRAMES, n_frames - start)
+            index = (start + np.arange(count))[:, None] * hop + np.arange(frame_size)
+            spectrum = np.log1p(np.abs(np.fft.rfft(samples[index] * window, axis=1)))
+            for band, (low, high) in enumerate(AudioFingerprint.BANDS):
+                band_bin[band, start:start + count] = low + spectrum[:, low:high].argmax(axis=1)
+                band_energy[band, start:start + count] = spectrum[:, low:high].max(axis=1)
+
+        # 峰值：時間上的局部最大值，且高於該頻帶的中位數（略過靜音）
+        size = AudioFingerprint.PEAK_NEIGHBORHOOD
+        padded = np.pad(band_energy, ((0, 0), (size, size)), constant_values=-np.inf)
+        local_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * size + 1, axis=1).max(axis=2)
+        is_peak = (band_energy == local_max) & (band_energy > np.median(band_energy, axis=1, keepdims=True))
+        bands, times = np.nonzero(is_peak)
+        order = np.argsort(times, kind="stable")
+        peaks = list(zip(times[order].tolist(), band_bin[bands[order], times[order]].tolist()))
+
+        # 峰值配對產生雜湊：頻率1(8 bits) | 頻率2(8 bits) | 時間差(6 bits)
+        hashes = []
+        for i, (time1, freq1) in enumerate(peaks):
+            paired = 0
+            for time2, freq2 in peaks[i + 1:]:
+                delta = time2 - time1
+                if delta > AudioFingerprint.MAX_DELTA:
+                    break
+                if delta == 0:
+                    continue
+                hashes.append(((freq1 << 14) | (freq2 << 6) | delta, time1))
+                paired += 1
+                if paired >= AudioFingerprint.FAN_OUT:
+                    break
+        return hashes
+
+
+# 🔹 **聲紋索引**
+class FingerprintIndex:
+    """
+    本機聲紋索引（SQLite），用來辨識重新編碼或不同容器的同一份錄音
+    - 比對時統計相同雜湊的時間差（位移），同一位移累積最多者即為候選
+    - 既有錄音必須完整落在本次音檔內，避免會議片段誤判為整場會議；
+      本次音檔多出的開頭或結尾由呼叫端另行轉錄
+    - 預設只比對同一使用者的錄音（FINGERPRINT_SHARE_ACROSS_USERS 可開放跨使用者沿用）
+    - 超過保存期限（FINGERPRINT_MAX_AGE_DAYS）的錄音連同逐字稿一併刪除
+    """
+
+    BATCH_SIZE = 500  # 每次查詢的雜湊數（SQLite 參數上限）
+
+    _lock = threading.Lock()  # 同一行程內序列化寫入
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.FINGERPRINT_DB_PATH
+
+    def _connect(self):
+        folder = os.path.dirname(self.db_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS recordings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT,
+                name TEXT,
+                duration REAL,
+                segments TEXT,
+                created_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                hash INTEGER,
+                recording_id INTEGER,
+                offset INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_fingerprints_hash ON fingerprints (hash);
+            CREATE INDEX IF NOT EXISTS idx_fingerprints_recording ON fingerprints (recording_id);
+            """
+        )
+        # 舊版索引沒有 user_id 欄位，補上後舊資料不屬於任何使用者
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(recordings)")}
+        if "user_id" not in columns:
+            connection.execute("ALTER TABLE recordings ADD COLUMN user_id TEXT")
+        return connection
+
+    def find(self, hashes, duration, user_id=None):
+        """
+        尋找近似重複的錄音
+
+        參數:
+        - hashes: AudioFingerprint.compute 的結果
+        - duration: 音檔長度（秒）
+        - user_id: 使用者識別，只比對該使用者的錄音（開放跨使用者沿用時比對全部）
+
+        回傳:
+        - 吻合時回傳 {"name", "user_id", "segments", "offset_seconds", "covered_start", "covered_end", "score"}，
+          covered_start ~ covered_end 為既有逐字稿涵蓋本次音檔的範圍（秒）；否則 None
+        """
+        if not hashes:
+            return None
+
+        # 長錄音只取均勻分布的部分雜湊查詢，已足以判斷
+        step = max(1, len(hashes) // Config.FINGERPRINT_QUERY_HASHES)
+        query = hashes[::step]
+        # 峰值可能因取樣位移早晚一個影格，時間差 ±1 的雜湊也一併查詢
+        times_by_hash = {}
+        for hash_value, offset in query:
+            delta = hash_value & AudioFingerprint.MAX_DELTA
+            for variant in (delta - 1, delta, delta + 1):
+                if 0 < variant <= AudioFingerprint.MAX_DELTA:
+                    key = (hash_value & ~AudioFingerprint.MAX_DELTA) | variant
+                    times_by_hash.setdefault(key, []).append(offset)
+
+        shared = Config.FINGERPRINT_SHARE_ACROSS_USERS
+        votes = Counter()
+        connection = self._connect()
+        try:
+            keys = list(times_by_hash)
+            for start in range(0, len(keys), self.BATCH_SIZE):
+                batch = keys[start:start + self.BATCH_SIZE]
+                query_sql = (
+                    f"SELECT fingerprints.hash, fingerprints.recording_id, fingerprints.offset "
+                    f"FROM fingerprints JOIN recordings ON recordings.id = fingerprints.recording_id "
+                    f"WHERE fingerprints.hash IN ({','.join('?' * len(batch))})"
+                )
+                if not shared:
+                    query_sql += " AND recordings.user_id = ?"
+                rows = connection.execute(query_sql, batch if shared else batch + [user_id])
+                for hash_value, recording_id, offset in rows:
+                    for query_offset in times_by_hash[hash_value]:
+                        votes[(recording_id, offset - query_offset)] += 1
+            if not votes:
+                return None
+
+            # 重新編碼可能讓峰值偏移一個影格，合併相鄰位移的票數
+            def score(key):
+                recording_id, delta = key
+                return sum(votes.get((recording_id, delta + shift), 0) for shift in (-1, 0, 1))
+
+            best = max(votes, key=score)
+            matched = score(best)
+            ratio = matched / len(query)
+            if matched < Config.FINGERPRINT_MIN_MATCHES or ratio < Config.FINGERPRINT_MATCH_RATIO:
+                return None
+
+            name, owner, stored_duration, segments = connection.execute(
+                "SELECT name, user_id, duration, segments FROM recordings WHERE id = ?", (best[0],)
+            ).fetchone()
+        finally:
+            connection.close()
+
+        # 索引中的時間 = 本次時間 + 位移；既有錄音超出本次音檔（本次只是片段）時不沿用
+        offset_seconds = best[1] / AudioFingerprint.frames_per_second()
+        covered_start, covered_end = -offset_seconds, stored_duration - offset_seconds
+        tolerance = Config.FINGERPRINT_DURATION_TOLERANCE
+        if covered_start < -tolerance or covered_end > duration + tolerance:
+            return None
+
+        return {
+            "name": name,
+            "user_id": owner,
+            "segments": json.loads(segments),
+            "offset_seconds": offset_seconds,
+            "covered_start": max(0.0, covered_start),
+            "covered_end": min(duration, covered_end),
+            "score": ratio,
+        }
+
+    def prune(self, max_age_seconds=None):
+        """刪除超過保存期限的錄音、逐字稿與其聲紋，回傳刪除的錄音數"""
+        if max_age_seconds is None:
+            max_age_seconds = Config.FINGERPRINT_MAX_AGE_DAYS * 86400
+        if not os.path.exists(self.db_path):
+            return 0
+        cutoff = time.time() - max_age_seconds
+        with FingerprintIndex._lock:
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.execute(
+                        "DELETE FROM fingerprints WHERE recording_id IN "
+                        "(SELECT id FROM recordings WHERE created_at < ?)", (cutoff,)
+                    )
+                    return connection.execute("DELETE FROM recordings WHERE created_at < ?", (cutoff,)).rowcount
+            finally:
+                connection.close()
+
+    def add(self, hashes, duration, segments, name="", user_id=None):
+        """將已轉錄的錄音加入索引"""
+        if not hashes:
+            return
+        with FingerprintIndex._lock:
+            connection = self._connect()
+            try:
+                with connection:
+                    cursor = connection.execute(
+                        "INSERT INTO recordings (user_id, name, duration, segments, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (user_id, name, duration, json.dumps(segments, ensure_ascii=False), time.time())
+                    )
+                    connection.executemany(
+                        "INSERT INTO fingerprints (hash, recording_id, offset) VALUES (?, ?, ?)",
+                        ((hash_value, cursor.lastrowid, offset) for hash_value, offset in hashes)
+                    )
+            finally:
+                connection.close()
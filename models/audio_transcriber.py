@@ -1,9 +1,17 @@
-import whisper
+import logging
 import os
 import subprocess
 import tempfile
+import threading
+import wave
 import streamlit as st
 from config import Config  # ✅ 匯入配置參數（包含 Whisper 模型類型）
+from models.audio_fingerprint import AudioFingerprint, FingerprintIndex
+from models.cancellation import CancellationToken, JobCancelledError
+from models.inference_scheduler import InferenceScheduler
+from models.transcription_checkpoint import TranscriptionCheckpoint
+
+logger = logging.getLogger(__name__)
 
 
 class AudioTranscriber:
@@ -13,29 +21,66 @@ class AudioTranscriber:
     - 不進行語者辨識（不使用 PaddleSpeech）
     """
 
-    _whisper_model = None  # Whisper 模型快取，避免每次都重新載入模型
+    SAMPLE_RATE = 16000  # Whisper 輸入取樣率
+    VTT_HEADER = "WEBVTT"
+    MIN_GAP_SECONDS = 1.0  # 沿用既有逐字稿時，未涵蓋的開頭或結尾超過此長度才另行轉錄
+
+    _whisper_models = {}  # 各推論執行位的 Whisper 模型快取，避免每次都重新載入模型
+    _model_lock = threading.Lock()  # 避免背景預載與使用者請求同時載入模型
+    _scheduler = InferenceScheduler()  # 所有 session 共用的推論排程，每個執行位使用各自的模型
+    _fingerprint_index = FingerprintIndex()  # 聲紋索引，辨識同一使用者重新編碼後再次上傳的同一份錄音
 
     def __init__(self):
         """初始化 Whisper 模型（僅載入一次）"""
-        if AudioTranscriber._whisper_model is None:
-            # ✅ 從設定檔讀取模型名稱（如 tiny、base、small、medium）
-            AudioTranscriber._whisper_model = whisper.load_model(Config.AUDIO_MODEL_TYPE)
+        AudioTranscriber.load_model()
+
+    @staticmethod
+    def load_model(slot_index=0):
+        """
+        載入指定推論執行位的 Whisper 模型（執行緒安全，每個執行位僅載入一次）
+
+        Whisper 解碼時會在模型上掛 KV cache hook，兩筆推論共用同一個模型會互相污染，
+        因此每個執行位各有一個模型實例（記憶體用量隨 WHISPER_MAX_CONCURRENT_JOBS 增加）。
+        whisper 與 torch 匯入耗時，延後到第一次需要時才匯入，讓登入頁面能快速顯示
+        """
+        model = AudioTranscriber._whisper_models.get(slot_index)
+        if model is None:
+            with AudioTranscriber._model_lock:
+                model = AudioTranscriber._whisper_models.get(slot_index)
+                if model is None:
+                    import whisper
+                    # ✅ 從設定檔讀取模型名稱（如 tiny、base、small、medium）
+                    model = whisper.load_model(Config.AUDIO_MODEL_TYPE)
+                    AudioTranscriber._whisper_models[slot_index] = model
+        return model
 
-    def transcribe(self, uploaded_audio):
+    def transcribe(self, uploaded_audio, user_id=None, cancel_token=None, on_segments=None):
         """
         將上傳的音檔轉為逐字稿，並輸出為 VTT 字幕格式
 
         參數:
         - uploaded_audio: Streamlit 的 UploadedFile 音檔物件
+        - user_id: 使用者識別，用於推論排隊（預設讀取 session_state）
+        - cancel_token: CancellationToken，等待 ffmpeg 與 Whisper 時定期輪詢；取消或 Streamlit 中止腳本時
+          立即結束 ffmpeg，Whisper 則在目前的音訊區段於背景跑完後停止
+        - on_segments: 每完成一個音訊區段即呼叫 on_segments(segments)，供後續處理邊轉錄邊進行
 
         回傳:
         - VTT 格式字串，內含時間戳記與轉錄內容
+
+        例外:
+        - JobCancelledError: 工作已取消（暫存檔已清除）
         """
+        cancel_token = cancel_token or CancellationToken()
         if uploaded_audio.size == 0:
             st.error("⚠️ 音檔為空，請重新上傳。")
             return ""
 
         file_extension = os.path.splitext(uploaded_audio.name)[-1].lower()  # 取得副檔名
+        TranscriptionCheckpoint.prune()  # 清除已放棄工作留下的過期存檔
+        checkpoint = TranscriptionCheckpoint(TranscriptionCheckpoint.key_for(uploaded_audio.getbuffer()))
+        if not checkpoint.acquire():
+            logger.info("同一音檔正由其他工作轉錄，本次不使用進度存檔")
 
         # 將音檔暫存至本地，避免直接讀取上傳物件造成錯誤
         with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_audio:
@@ -45,56 +90,274 @@ class AudioTranscriber:
         wav_audio_path = None  # WAV 格式音檔路徑（Whisper 需要 16kHz 單聲道）
         try:
             # 將原始音檔轉為 Whisper 支援格式
-            wav_audio_path = self.convert_audio_to_wav(temp_audio_path, file_extension)
+            wav_audio_path = self.convert_audio_to_wav(temp_audio_path, file_extension, cancel_token)
             if not wav_audio_path:
                 st.error("⚠️ 音檔轉換失敗，請上傳有效音檔。")
                 return ""
 
-            # 使用 Whisper 進行語音轉文字（支援中文）
-            transcript_result = self._whisper_model.transcribe(
-                wav_audio_path,
-                language="zh",              # 🔸 強制設定為中文語系
-                word_timestamps=True,       # 🔸 回傳每個詞的時間戳
-                temperature=0.2             # 🔸 控制生成隨機性（越低越穩定）
-            )
+            if user_id is None:
+                user_id = st.session_state.get("user_id") or Config.DEFAULT_USER_ID
+
+            audio = self.load_wav_pcm(wav_audio_path)
+            duration = len(audio) / self.SAMPLE_RATE
+            fingerprint = self._compute_fingerprint(audio)
+
+            # 同一場會議以不同格式或位元率再次上傳時，沿用既有逐字稿，只轉錄多出的開頭與結尾
+            match = self._find_duplicate(fingerprint, duration, user_id)
+            if match is not None:
+                segments, has_new_audio = self._reuse_transcript(audio, match, user_id, cancel_token, on_segments)
+            else:
+                segments = self._transcribe_windows(audio, user_id, cancel_token, checkpoint, on_segments)
+                has_new_audio = True
+            if has_new_audio:
+                self._index_transcript(fingerprint, duration, segments, uploaded_audio.name, user_id)
 
             # 將 Whisper 結果轉為 VTT 字幕格式
-            vtt_output = self.format_as_vtt(transcript_result)
+            vtt_output = self.format_as_vtt({"segments": segments})
+            checkpoint.clear()  # 完成後不再需要進度存檔（中斷或取消時保留以便接續）
             return vtt_output
 
+        except JobCancelledError:
+            raise
+
         except Exception as error:
             st.error(f"⚠️ 音檔轉錄失敗: {error}")
             return ""
 
         finally:
-            # 刪除暫存檔案，釋放磁碟空間
-            os.remove(temp_audio_path)
+            checkpoint.release()
+            # 刪除暫存檔案，釋放磁碟空間（取消時同樣清除）
+            if os.path.exists(temp_audio_path):
+                os.remove(temp_audio_path)
             if wav_audio_path and os.path.exists(wav_audio_path):
                 os.remove(wav_audio_path)
 
+    def _compute_fingerprint(self, audio):
+        """計算聲紋指紋；失敗時不影響轉錄"""
+        if not Config.FINGERPRINT_ENABLED:
+            return None
+        try:
+            return AudioFingerprint.compute(audio)
+        except Exception as error:
+            logger.warning("聲紋計算失敗: %s", error)
+            return None
+
+    def _find_duplicate(self, fingerprint, duration, user_id):
+        """查詢聲紋索引（預設只比對同一使用者的錄音），找到近似重複的錄音時回傳比對結果"""
+        if not fingerprint:
+            return None
+        try:
+            self._fingerprint_index.prune()  # 先刪除逾期的錄音與逐字稿
+        except Exception as error:
+            logger.warning("聲紋索引清理失敗: %s", error)
+        try:
+            match = self._fingerprint_index.find(fingerprint, duration, user_id)
+        except Exception as error:
+            logger.warning("聲紋索引查詢失敗: %s", error)
+            return None
+        if match is None:
+            return None
+
+        # 只顯示自己上傳的檔名，不透露其他使用者的資料
+        source = f"（{match['name']}）" if match["user_id"] == user_id else ""
+        st.info(f"♻️ 偵測到相同內容的錄音{source}，沿用既有逐字稿")
+        return match
+
+    def _reuse_transcript(self, audio, match, user_id, cancel_token, on_segments=None):
+        """
+        沿用既有逐字稿，並轉錄本次音檔多出的開頭與結尾（例如錄影多錄了會後的部分）
+
+        回傳:
+        - (segments, 是否轉錄了新的音訊)
+        """
+        duration = len(audio) / self.SAMPLE_RATE
+        leading = self._transcribe_range(audio, 0.0, match["covered_start"], user_id, cancel_token, on_segments)
+
+        # 索引中的時間 = 本次時間 + 位移，校正回本次上傳的時間軸
+        reused = [
+            {**segment, "start": max(0.0, segment["start"]), "end": min(duration, segment["end"])}
+            for segment in self.shift_segments(match["segments"], -match["offset_seconds"])
+            if segment["end"] > 0 and segment["start"] < duration
+        ]
+        if on_segments:
+            on_segments(reused)
+
+        trailing = self._transcribe_range(audio, match["covered_end"], duration, user_id, cancel_token, on_segments)
+        return leading + reused + trailing, bool(leading or trailing)
+
+    def _transcribe_range(self, audio, start, end, user_id, cancel_token, on_segments=None):
+        """轉錄 start ~ end 秒的音訊，回傳已校正時間的 segments（過短時略過）"""
+        if end - start < self.MIN_GAP_SECONDS:
+            return []
+
+        def shifted(segments):
+            on_segments(self.shift_segments(segments, start))
+
+        # 只是補齊既有逐字稿的片段，不持有存檔，進度僅保留在記憶體中
+        checkpoint = TranscriptionCheckpoint(f"range_{start:.0f}_{end:.0f}")
+        segments = self._transcribe_windows(
+            audio[int(start * self.SAMPLE_RATE):int(end * self.SAMPLE_RATE)],
+            user_id, cancel_token, checkpoint, shifted if on_segments else None
+        )
+        return self.shift_segments(segments, start)
+
+    def _index_transcript(self, fingerprint, duration, segments, name, user_id):
+        """將新轉錄的錄音加入聲紋索引"""
+        if not fingerprint:
+            return
+        try:
+            self._fingerprint_index.add(fingerprint, duration, segments, name, user_id)
+        except Exception as error:
+            logger.warning("聲紋索引寫入失敗: %s", error)
+
+    def _transcribe_windows(self, audio, user_id, cancel_token, checkpoint, on_segments=None):
+        """
+        將音訊切成區段逐段轉錄，回傳已校正時間的 segments
+
+        - 區段不在固定時間點切開：非最後一段時捨棄最後一個 segment（可能被切在句子中間），
+          下一段從前一個完整 segment 的結尾（通常是停頓處）開始重新轉錄
+        - 推論期間腳本執行緒持續輪詢，取消、按下停止或關閉頁面時立即中止（進行中的區段於背景跑完）
+        - 每段各自向排程器取得執行位，長音檔不會長時間佔住模型
+        - 以前一段的文字作為 initial_prompt，延續上下文
+        - 每段完成即寫入進度存檔；重試時從存檔的位置繼續並沿用當時的上下文
+        """
+        window_samples = int(Config.WHISPER_WINDOW_SECONDS * self.SAMPLE_RATE)
+        min_advance = window_samples // 2  # 每段至少前進的長度，避免長時間無停頓時原地重複
+        total_samples = len(audio)
+
+        progress = st.progress(0.0, text="音訊轉錄中...")
+        queue_status = st.empty()
+
+        waiting = {}  # 背景執行緒回報的排隊狀態，由腳本執行緒顯示
+
+        def record_queue_status(position, eta_seconds):
+            cancel_token.raise_if_cancelled()  # 已取消時退出排隊
+            waiting["status"] = (position, eta_seconds)
+
+        def show_queue_status():
+            status = waiting.get("status")
+            if status:
+                queue_status.info(f"⏳ 排隊中：前方還有 {status[0] - 1} 筆工作，預估等待約 {int(status[1])} 秒")
+            else:
+                queue_status.empty()
+
+        def transcribe_window(window, previous_text):
+            # 排隊取得推論執行位；在背景執行緒中持有，取消後仍會跑完目前區段才釋放模型
+            with self._scheduler.slot(user_id, len(window) / self.SAMPLE_RATE, record_queue_status) as slot_index:
+                waiting["status"] = None
+                # 使用 Whisper 進行語音轉文字（支援中文），每個執行位使用各自的模型實例
+                return self.load_model(slot_index).transcribe(
+                    window,
+                    language="zh",              # 🔸 強制設定為中文語系
+                    word_timestamps=True,       # 🔸 回傳每個詞的時間戳
+                    temperature=0.2,            # 🔸 控制生成隨機性（越低越穩定）
+                    initial_prompt=previous_text or None  # 🔸 延續前一段的上下文
+                )
+
+        def show_progress(offset):
+            ratio = min(1.0, offset / total_samples) if total_samples else 1.0
+            progress.progress(ratio, text=f"音訊轉錄中...（{ratio:.0%}）")
+
+        checkpoint.load()
+        segments, previous_text, offset = checkpoint.segments, checkpoint.context, checkpoint.next_offset
+        if offset:
+            st.info(f"🔁 偵測到先前的轉錄進度，從 {self.format_timestamp(offset / self.SAMPLE_RATE)} 繼續")
+            if on_segments:
+                on_segments(segments)
+            show_progress(offset)
+
+        while offset < total_samples:
+            cancel_token.raise_if_cancelled()
+            window = audio[offset:offset + window_samples]
+            is_last = offset + window_samples >= total_samples
+
+            # Whisper 在背景執行緒推論，腳本執行緒定期更新排隊狀態，使用者停止時可立即中止腳本
+            result = cancel_token.run(transcribe_window, window, previous_text, on_poll=show_queue_status)
+            queue_status.empty()
+
+            kept, next_offset = result["segments"], offset + len(window)
+            if not is_last and len(kept) > 1:
+                # 最後一個 segment 可能被區段邊界切斷，改由下一段從前一個 segment 結尾重新轉錄
+                boundary = int(kept[-2]["end"] * self.SAMPLE_RATE)
+                if boundary >= min_advance:
+                    kept, next_offset = kept[:-1], offset + boundary
+
+            window_segments = self.shift_segments(kept, offset / self.SAMPLE_RATE)
+            segments.extend(window_segments)
+            previous_text = "".join(segment["text"] for segment in kept).strip() or previous_text
+            offset = next_offset
+            checkpoint.save_window(window_segments, previous_text, offset)
+            if on_segments:
+                on_segments(window_segments)
+            show_progress(offset)
+
+        progress.empty()
+        return segments
+
     @staticmethod
-    def convert_audio_to_wav(input_path, file_extension):
+    def convert_audio_to_wav(input_path, file_extension, cancel_token=None):
         """
         將輸入音檔轉換為 Whisper 支援的 16kHz 單聲道 WAV 格式
 
         參數:
         - input_path: 原始音檔路徑
         - file_extension: 音檔副檔名（用於命名）
+        - cancel_token: CancellationToken，等待期間定期輪詢；取消或 Streamlit 中止腳本時立即結束 ffmpeg
 
         回傳:
         - 轉換後的 WAV 檔案路徑，失敗則回傳 None
         """
+        cancel_token = cancel_token or CancellationToken()
         output_path = input_path.rsplit(".", 1)[0] + ".wav"  # 轉換後的檔名
+        process = None
 
         try:
             # 使用 ffmpeg 進行格式轉換
             cmd = ["ffmpeg", "-y", "-i", input_path, "-ar", "16000", "-ac", "1", output_path]
-            subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            cancel_token.register(process.kill)  # 取消時結束子程序
+            # 在背景執行緒讀取輸出，腳本執行緒定期輪詢，讓停止按鈕與關閉頁面能及時生效
+            _, stderr = cancel_token.run(process.communicate)
+            cancel_token.raise_if_cancelled()
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr)
 
             return output_path if os.path.exists(output_path) else None
+        except JobCancelledError:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
         except Exception as error:
             st.error(f"⚠️ 音檔轉換失敗: {error}")
             return None
+        except BaseException:
+            # Streamlit 中止腳本（停止、重新執行或關閉頁面）：結束 ffmpeg 並清除不完整的輸出
+            if process is not None:
+                process.kill()
+                process.wait()
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        finally:
+            if process is not None:
+                cancel_token.unregister(process.kill)
+
+    @staticmethod
+    def load_wav_pcm(wav_path):
+        """讀取 16kHz 單聲道 16-bit WAV，回傳 Whisper 使用的 float32 波形（-1 ~ 1）"""
+        import numpy as np
+
+        with wave.open(wav_path, "rb") as wav_file:
+            frames = wav_file.readframes(wav_file.getnframes())
+        return np.frombuffer(frames, np.int16).astype(np.float32) / 32768.0
+
+    @staticmethod
+    def shift_segments(segments, offset):
+        """將區段內的時間加上區段起點，只保留產生 VTT 所需的欄位"""
+        return [
+            {"start": segment["start"] + offset, "end": segment["end"] + offset, "text": segment["text"]}
+            for segment in segments
+        ]
 
     @staticmethod
     def format_as_vtt(transcript_result):
@@ -107,9 +370,15 @@ class AudioTranscriber:
         回傳:
         - 字串形式的 VTT 字幕內容（含時間與文字）
         """
-        vtt_output = ["WEBVTT\n"]  # 開頭加上 VTT 標記
+        vtt_output = [f"{AudioTranscriber.VTT_HEADER}\n"]  # 開頭加上 VTT 標記
+        vtt_output.extend(AudioTranscriber.format_vtt_cues(transcript_result["segments"]))
+        return "\n".join(vtt_output)
 
-        for segment in transcript_result["segments"]:
+    @staticmethod
+    def format_vtt_cues(segments):
+        """將 segments 轉為 VTT 字幕行（時間軸與內容交替），不含標頭"""
+        vtt_output = []
+        for segment in segments:
             start_time = segment["start"]
             end_time = segment["end"]
 
@@ -125,7 +394,7 @@ class AudioTranscriber:
             vtt_output.append(f"{start_vtt_time} --> {end_vtt_time}")
             vtt_output.append(f"{text}\n")
 
-        return "\n".join(vtt_output)
+        return vtt_output
 
     @staticmethod
     def format_timestamp(seconds):
@@ -0,0 +1,103 @@
+import threading
+from concurrent.futures import Future, wait
+
+
+class JobCancelledError(Exception):
+    """工作已被使用者取消"""
+
+
+# 🔹 **工作取消**
+class CancellationToken:
+    """
+    協作式取消：執行中的工作在各階段之間檢查是否已取消
+    - 取消時執行已登記的回呼（例如結束 ffmpeg 子程序）
+    - 可跨執行緒使用
+    - 長時間等待（ffmpeg、Whisper、LLM）時改為定期輪詢，並在建立權杖的執行緒（Streamlit 腳本執行緒）
+      呼叫 heartbeat；Streamlit 只在 st.* 呼叫時處理停止、重新執行或關閉頁面，
+      如此腳本才能及時中止並進入 finally 取消工作
+    """
+
+    POLL_INTERVAL = 0.5  # 等待時輪詢的間隔（秒）
+
+    def __init__(self, heartbeat=None):
+        """
+        參數:
+        - heartbeat: 等待期間在建立權杖的執行緒中定期呼叫（例如更新 Streamlit 的 placeholder）
+        """
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._heartbeat = heartbeat
+        self._owner = threading.current_thread()
+
+    @property
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """取消工作並執行所有登記的回呼（重複呼叫不會重複執行）"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass  # 回收資源失敗不影響其他回呼
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise JobCancelledError("工作已取消")
+
+    def poll(self):
+        """等待迴圈中呼叫：已取消則拋出例外，在建立權杖的執行緒中另外執行 heartbeat"""
+        self.raise_if_cancelled()
+        if self._heartbeat is not None and threading.current_thread() is self._owner:
+            self._heartbeat()
+
+    def result(self, future, on_poll=None):
+        """等待 future 完成並回傳結果，期間定期 poll（及 on_poll），不會無限期阻塞"""
+        while True:
+            self.poll()
+            if on_poll:
+                on_poll()
+            # 以 wait 判斷是否完成，避免把 func 本身拋出的 TimeoutError 誤認為等待逾時
+            done, _ = wait([future], timeout=self.POLL_INTERVAL)
+            if done:
+                return future.result()
+
+    def run(self, func, *args, on_poll=None):
+        """
+        在背景執行緒執行 func(*args)，呼叫端執行緒定期 poll 等待結果
+
+        呼叫端中止（取消或 Streamlit 停止腳本）時不等待 func 結束；
+        func 應自行檢查取消狀態，或透過 register 登記的回呼結束
+        """
+        future = Future()
+
+        def target():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(func(*args))
+            except BaseException as error:
+                future.set_exception(error)
+
+        threading.Thread(target=target, name="cancellable-job", daemon=True).start()
+        return self.result(future, on_poll)
+
+    def register(self, callback):
+        """登記取消時要執行的回呼；已取消則立即執行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def unregister(self, callback):
+        """工作階段結束後移除回呼，避免誤觸已結束的資源"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
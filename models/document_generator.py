@@ -5,7 +5,7 @@ import random
 import re
 from config import Config
 from io import BytesIO
-from docxtpl import DocxTemplate
+from models.transcript_preprocessor import TranscriptPreprocessor
 
 # 🔹 **Word 檔案產生**
 class DocumentGenerator:
@@ -14,6 +14,8 @@ class DocumentGenerator:
     @staticmethod
     def create_word_document(summary_text):
         """建立 Word 文件"""
+        from docxtpl import DocxTemplate  # 延後匯入，只有下載 Word 時才需要
+
         # 載入 Word 模板檔案 (template.docx 必須存在於程式目錄中)
         doc = DocxTemplate("template.docx")
 
@@ -54,6 +56,30 @@ class DocumentGenerator:
             st.error(f"⚠️ VTT 解析失敗: {e}")
             return ""
 
+    @staticmethod
+    def preprocess_VTT(vtt_bytes, drop_fillers=None):
+        """
+        從 VTT 檔案提取精簡逐字稿（移除標記、合併發言者、刪除滾動字幕重複）
+
+        回傳:
+        - (逐字稿文字, 統計)，統計包含 tokens_before（原本 extract_VTT 的結果）、tokens_after 與 reduction
+        """
+        try:
+            vtt_text = vtt_bytes.decode('utf-8-sig')
+            text = TranscriptPreprocessor.preprocess(vtt_text, drop_fillers)
+        except Exception as e:
+            st.error(f"⚠️ VTT 解析失敗: {e}")
+            return "", None
+
+        tokens_before = TranscriptPreprocessor.estimate_tokens(DocumentGenerator.extract_VTT(vtt_bytes))
+        tokens_after = TranscriptPreprocessor.estimate_tokens(text)
+        stats = {
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "reduction": 1 - tokens_after / tokens_before if tokens_before else 0.0,
+        }
+        return text, stats
+
     @staticmethod
     def save_files(summary, prompt, file, user_id):
         user_folder = os.path.join(Config.OUTPUT_FOLDER, user_id)
@@ -75,13 +101,18 @@ class DocumentGenerator:
 
     @staticmethod
     def split_text(text, max_tokens=7000):
-        words, chunks, chunk, length = text.split(), [], [], 0
-        for word in words:
-            length += len(word) + 1
-            chunk.append(word)
-            if length >= max_tokens:
-                chunks.append(" ".join(chunk))
-                chunk, length = [], 0
+        return list(DocumentGenerator.split_text_stream([text], max_tokens))
+
+    @staticmethod
+    def split_text_stream(texts, max_tokens=7000):
+        """逐段讀入文字並在分段完成時立即產出；切分結果與 split_text 對整段文字相同"""
+        chunk, length = [], 0
+        for text in texts:
+            for word in text.split():
+                length += len(word) + 1
+                chunk.append(word)
+                if length >= max_tokens:
+                    yield " ".join(chunk)
+                    chunk, length = [], 0
         if chunk:
-            chunks.append(" ".join(chunk))
-        return chunks
\ No newline at end of file
+            yield " ".join(chunk)
\ No newline at end of file
@@ -0,0 +1,175 @@
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from config import Config
+
+
+class _Ticket:
+    """排隊中的一筆推論工作"""
+
+    def __init__(self, user_id, audio_seconds):
+        self.user_id = user_id
+        self.audio_seconds = audio_seconds
+        self.admitted = False
+        self.started_at = None
+        self.slot_index = None  # 放行後分配的執行位編號（對應各自的模型實例）
+
+
+# 🔹 **推論排程**
+class InferenceScheduler:
+    """
+    Whisper 推論排程器
+    - 同時最多執行 max_concurrent 筆推論，其餘排隊
+    - 每筆推論分配一個執行位編號，呼叫端依編號使用各自的模型實例
+      （Whisper 解碼時會在模型上掛 KV cache hook，同一個模型不可同時推論）
+    - 各使用者各自排隊，輪流（round-robin）取出，避免單一使用者佔滿模型
+    - 依目前執行中的推論數分配 torch 執行緒數，單獨執行時可使用全部核心
+    - 依過去的處理速度估計排隊位置與等待時間
+    """
+
+    POLL_INTERVAL = 1.0         # 排隊時更新等待資訊的間隔（秒）
+    RATE_SMOOTHING = 0.3        # 處理速度的更新權重
+    DEFAULT_AUDIO_SECONDS = 600  # 無法得知音檔長度時的估計值
+
+    def __init__(self, max_concurrent=None, threads_per_slot=None):
+        self.max_concurrent = max(1, max_concurrent or Config.WHISPER_MAX_CONCURRENT_JOBS)
+        self.threads_per_slot = threads_per_slot or Config.WHISPER_THREADS_PER_JOB  # None：依執行中數量分配
+        self.seconds_per_audio_second = Config.WHISPER_INITIAL_SPEED  # 處理 1 秒音訊所需秒數
+
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # user_id -> deque[_Ticket]，順序即輪替順序
+        self._running = []
+
+    @contextmanager
+    def slot(self, user_id, audio_seconds=None, on_wait=None):
+        """
+        取得一個推論執行位，離開 with 區塊時釋放
+
+        參數:
+        - user_id: 使用者識別（公平排隊的單位）
+        - audio_seconds: 音檔長度（秒），用於估計處理時間
+        - on_wait: 排隊時定期呼叫 on_wait(position, eta_seconds)，在呼叫端執行緒中執行
+
+        回傳（with ... as slot_index）:
+        - 執行位編號（0 ~ max_concurrent - 1），同一時間不會分配給兩筆推論
+        """
+        ticket = _Ticket(user_id, audio_seconds)
+        with self._cond:
+            self._queues.setdefault(user_id, deque()).append(ticket)
+            self._dispatch_locked()
+
+        try:
+            self._wait_for_admission(ticket, on_wait)
+        except BaseException:
+            self._withdraw(ticket)
+            raise
+
+        with self._cond:
+            running = len(self._running)
+        self._configure_torch(running)
+        try:
+            yield ticket.slot_index
+        finally:
+            self._release(ticket)
+
+    def status(self):
+        """回傳目前執行中與排隊中的工作數量"""
+        with self._cond:
+            waiting = sum(len(queue) for queue in self._queues.values())
+            return {"running": len(self._running), "waiting": waiting, "max_concurrent": self.max_concurrent}
+
+    def _wait_for_admission(self, ticket, on_wait):
+        while True:
+            with self._cond:
+                if ticket.admitted:
+                    return
+                position, eta = self._estimate_locked(ticket)
+            # 在鎖外回呼，避免 UI 更新阻塞其他使用者
+            if on_wait:
+                on_wait(position, eta)
+            with self._cond:
+                if not ticket.admitted:
+                    self._cond.wait(self.POLL_INTERVAL)
+
+    def _dispatch_locked(self):
+        """在有空位時依使用者輪替順序放行排隊中的工作"""
+        while len(self._running) < self.max_concurrent and self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            used = {running.slot_index for running in self._running}
+            ticket.slot_index = min(set(range(self.max_concurrent)) - used)
+            ticket.admitted = True
+            ticket.started_at = time.monotonic()
+            self._running.append(ticket)
+        self._cond.notify_all()
+
+    def _withdraw(self, ticket):
+        """排隊或執行中途離開（例如使用者關閉頁面）"""
+        if ticket.admitted:
+            self._release(ticket)
+            return
+        with self._cond:
+            queue = self._queues.get(ticket.user_id)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[ticket.user_id]
+            self._dispatch_locked()
+
+    def _release(self, ticket):
+        with self._cond:
+            if ticket not in self._running:
+                return
+            self._running.remove(ticket)
+            if ticket.audio_seconds:
+                rate = (time.monotonic() - ticket.started_at) / ticket.audio_seconds
+                self.seconds_per_audio_second += self.RATE_SMOOTHING * (rate - self.seconds_per_audio_second)
+            self._dispatch_locked()
+
+    def _dispatch_order_locked(self):
+        """模擬輪替放行順序，回傳排隊中工作的預計放行順序"""
+        queues = [list(queue) for queue in self._queues.values()]
+        order, round_index = [], 0
+        while any(len(queue) > round_index for queue in queues):
+            order.extend(queue[round_index] for queue in queues if len(queue) > round_index)
+            round_index += 1
+        return order
+
+    def _estimate_locked(self, ticket):
+        """回傳 (排隊位置, 預估等待秒數)"""
+        now = time.monotonic()
+        # 各執行位預計空出的時間
+        free_at = [
+            max(0.0, self._estimate_seconds(running) - (now - running.started_at))
+            for running in self._running
+        ]
+        free_at += [0.0] * (self.max_concurrent - len(free_at))
+        heapq.heapify(free_at)
+
+        order = self._dispatch_order_locked()
+        position = order.index(ticket) + 1
+        for ahead in order[:position - 1]:
+            heapq.heappush(free_at, heapq.heappop(free_at) + self._estimate_seconds(ahead))
+        return position, free_at[0]
+
+    def _estimate_seconds(self, ticket):
+        return (ticket.audio_seconds or self.DEFAULT_AUDIO_SECONDS) * self.seconds_per_audio_second
+
+    def _configure_torch(self, running):
+        """
+        依執行中的推論數設定 torch 執行緒數，於每次取得執行位時在推論執行緒中設定
+
+        單獨執行時使用全部核心；多筆同時執行時平均分配，避免 CPU 過度競爭。
+        其他執行中的推論在下一次取得執行位（下一個音訊區段）時依新的數量調整。
+        """
+        threads = self.threads_per_slot or max(1, (os.cpu_count() or 1) // max(1, running))
+        import torch
+        if torch.get_num_threads() != threads:
+            torch.set_num_threads(threads)
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(RuntimeError):
+    """所有 LLM 後端主機皆無法使用"""
+
+
+class LLMBackend:
+    """單一 LLM 後端主機的狀態"""
+
+    def __init__(self, base_url, client):
+        self.base_url = base_url
+        self.client = client
+        self.in_flight = 0            # 進行中的請求數
+        self.avg_latency = None       # 平均回應時間（秒，指數移動平均）
+        self.requests = 0             # 成功請求數
+        self.failures = 0             # 失敗請求數
+        self.unhealthy_until = 0.0    # 失敗後暫停分派至此時間點
+
+    def is_healthy(self, now):
+        return now >= self.unhealthy_until
+
+
+# 🔹 **LLM 多主機分派**
+class LLMBackendRouter:
+    """
+    將 LLM 請求分派至多台後端主機
+    - 每次選擇「進行中請求數 × 平均回應時間」最小的健康主機
+    - 請求失敗或逾時即暫停該主機並改送下一台
+    - 介面與 Ollama 相同（invoke），可直接取代單一模型
+    """
+
+    LATENCY_SMOOTHING = 0.3  # 平均回應時間的更新權重
+
+    def __init__(self, base_urls=None, model_name=None, timeout=None, cooldown=None, client_factory=None):
+        """
+        參數:
+        - base_urls: 後端主機網址列表（預設讀取 Config.LLM_API_BASE_URLS）
+        - model_name: 模型名稱（預設讀取 Config.LLM_MODEL_NAME）
+        - timeout: 單次請求逾時秒數
+        - cooldown: 主機失敗後暫停分派的秒數
+        - client_factory: 依網址建立客戶端的函式（需提供 invoke），預設建立 Ollama
+        """
+        base_urls = base_urls or Config.LLM_API_BASE_URLS
+        model_name = model_name or Config.LLM_MODEL_NAME
+        timeout = Config.LLM_REQUEST_TIMEOUT if timeout is None else timeout
+        self.cooldown = Config.LLM_BACKEND_COOLDOWN if cooldown is None else cooldown
+
+        if client_factory is None:
+            # 延後匯入 langchain，避免拖慢登入頁面載入
+            from langchain_community.llms import Ollama
+
+            def client_factory(base_url):
+                return Ollama(base_url=base_url, model=model_name, timeout=timeout)
+
+        self._lock = threading.Lock()
+        self.backends = [LLMBackend(url, client_factory(url)) for url in base_urls]
+
+    def invoke(self, prompt, cancel_token=None):
+        """
+        送出請求；失敗時依序改送其他主機，全部失敗才拋出 LLMUnavailableError
+
+        cancel_token 已取消時不再送出或改送請求（拋出 JobCancelledError）
+        """
+        tried = set()
+        last_error = None
+
+        while True:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            backend = self._acquire(tried)
+            if backend is None:
+                break
+
+            start = time.monotonic()
+            try:
+                response = backend.client.invoke(prompt)
+            except Exception as error:
+                self._release(backend, time.monotonic() - start, failed=True)
+                logger.warning("LLM 後端 %s 請求失敗，改送其他主機: %s", backend.base_url, error)
+                tried.add(backend.base_url)
+                last_error = error
+                continue
+
+            self._release(backend, time.monotonic() - start, failed=False)
+            return response
+
+        logger.error("所有 LLM 後端皆無法使用: %s", self.stats())
+        raise LLMUnavailableError(f"所有 LLM 後端皆無法使用: {last_error}") from last_error
+
+    def stats(self):
+        """回傳各主機的負載與健康狀態"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "base_url": backend.base_url,
+                    "in_flight": backend.in_flight,
+                    "avg_latency": backend.avg_latency,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                    "healthy": backend.is_healthy(now),
+                }
+                for backend in self.backends
+            ]
+
+    def _acquire(self, tried):
+        """選出負載最低的主機並登記為進行中；所有主機都暫停時仍嘗試未試過的主機"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [backend for backend in self.backends if backend.base_url not in tried]
+            if not candidates:
+                return None
+            healthy = [backend for backend in candidates if backend.is_healthy(now)]
+            candidates = healthy or candidates
+
+            # 尚未量測過的主機，以其他主機的平均回應時間估計
+            known = [backend.avg_latency for backend in self.backends if backend.avg_latency is not None]
+            default_latency = sum(known) / len(known) if known else 1.0
+
+            backend = min(
+                candidates,
+                key=lambda b: (b.in_flight + 1) * (b.avg_latency if b.avg_latency is not None else default_latency)
+            )
+            backend.in_flight += 1
+            return backend
+
+    def _release(self, backend, elapsed, failed):
+        """更新主機狀態：成功時記錄回應時間，失敗時暫停分派"""
+        with self._lock:
+            backend.in_flight -= 1
+            if failed:
+                backend.failures += 1
+                backend.unhealthy_until = time.monotonic() + self.cooldown
+                return
+            backend.requests += 1
+            backend.unhealthy_until = 0.0
+            if backend.avg_latency is None:
+                backend.avg_latency = elapsed
+            else:
+                backend.avg_latency += self.LATENCY_SMOOTHING * (elapsed - backend.avg_latency)
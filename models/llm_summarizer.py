@@ -1,32 +1,236 @@
-from langchain_openai import ChatOpenAI
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
-from langchain_community.llms import Ollama
+from models.cancellation import CancellationToken
+from models.llm_router import LLMBackendRouter
 
 # 🔹 **LLM 摘要生成**
 class LLMTextSummarizer:
     """使用 LLM 生成文本摘要"""
+
+    _routers = {}  # 依後端主機組合快取的分派器，讓所有使用者共享主機負載與健康狀態
+    _router_lock = threading.Lock()  # 避免多個 session 同時建立分派器
+
+    # 合併部分摘要時附加的指示，避免模型只摘要其中一段
+    MERGE_INSTRUCTION = (
+        "以下是同一場會議依時間順序分段整理的多份部分會議記錄，"
+        "請整合為一份完整的會議記錄：合併重複的議題，保留所有結論、決議與待辦事項，不要遺漏內容。\n"
+    )
+    # 單份部分摘要過長、無法與其他摘要一起合併時，先個別精簡
+    CONDENSE_INSTRUCTION = (
+        "以下是一場會議其中一段的部分會議記錄，內容過長，"
+        "請在 {limit} 字以內精簡整理：保留所有結論、決議與待辦事項，不要遺漏重點。\n"
+    )
+
     @staticmethod
-    def summary_generator(chunks, prompt):
+    def summary_generator(chunks, prompt, mode=None, backends=None, cancel_token=None, on_progress=None):
         """
         使用 LLM 對文本分段進行摘要生成
 
         參數：
         chunks (list): 分段的文本列表
-        prompt_template (str): 摘要提示語模板，需包含 {context} 占位符
+        prompt (str): 使用者自訂的摘要提示語
+        mode (str): flat 直接串接各段摘要；tree 逐層合併為單一會議記錄（預設讀取 Config）
+        backends (list): LLM 後端主機網址列表（預設使用共用的 Config.LLM_API_BASE_URLS）
+        cancel_token (CancellationToken): 取消後不再送出新的 LLM 請求
+        on_progress (callable): on_progress(stage, done, total)，每完成一次 LLM 呼叫時於呼叫端執行緒回報
 
         回傳：
-        str: 所有段落摘要的合併結果
+        str: 摘要結果
+
+        例外：
+        JobCancelledError: 工作已取消
+        LLMUnavailableError: 所有 LLM 後端皆無法使用
         """
-        prompt_template = prompt + "逐字稿：{context}"
-        # 初始化 LLM 模型（這裡使用的是 Ollama 自架模型）
-        model = Ollama(base_url=Config.LLM_API_BASE_URL, model=Config.LLM_MODEL_NAME)
-        summaries = []
+        cancel_token = cancel_token or CancellationToken()
+        # 取得 LLM 後端分派器（Ollama 自架模型，可多台主機）
+        model = LLMTextSummarizer.get_router(backends)
+
+        # map：各段獨立摘要，可平行處理
+        summaries = LLMTextSummarizer._map_chunks(model, chunks, prompt, cancel_token, on_progress)
+
+        return LLMTextSummarizer.reduce_summaries(model, summaries, prompt, mode, cancel_token, on_progress)
 
-        # 逐段處理文本
-        for chunk in chunks:
-            prompt = prompt_template.format(context=chunk)
-            response = model.invoke(prompt)
-            if response:
-                summaries.append(response)
+    @staticmethod
+    def summarize_chunk(model, chunk, prompt, cancel_token):
+        """對單一文本分段產生部分摘要（已取消則不送出請求）"""
+        cancel_token.raise_if_cancelled()
+        return model.invoke((prompt + "逐字稿：{context}").format(context=chunk), cancel_token=cancel_token)
 
+    @staticmethod
+    def reduce_summaries(model, summaries, prompt, mode=None, cancel_token=None, on_progress=None):
+        """依 mode 將部分摘要合併為最終結果（flat 直接串接；tree 逐層合併）"""
+        if (mode or Config.SUMMARY_REDUCE_MODE) == "tree":
+            return LLMTextSummarizer.tree_reduce(
+                model, summaries, prompt, cancel_token=cancel_token, on_progress=on_progress
+            )
         return "\n".join(summaries)
+
+    @staticmethod
+    def get_router(backends=None):
+        """取得後端分派器；相同的後端主機組合共用同一個分派器（執行緒安全）"""
+        key = tuple(backends or Config.LLM_API_BASE_URLS)
+        with LLMTextSummarizer._router_lock:
+            router = LLMTextSummarizer._routers.get(key)
+            if router is None:
+                router = LLMBackendRouter(list(key))
+                LLMTextSummarizer._routers[key] = router
+            return router
+
+    @staticmethod
+    def backend_stats(backends=None):
+        """回傳分派器中各後端主機的統計資料（預設為 Config.LLM_API_BASE_URLS 的分派器）"""
+        return LLMTextSummarizer.get_router(backends).stats()
+
+    @staticmethod
+    def tree_reduce(model, summaries, prompt,
+                    fan_in=None, max_depth=None, max_tokens=None, cancel_token=None, on_progress=None):
+        """
+        將部分摘要逐層分組合併，直到只剩一份會議記錄
+
+        每一層先將超過一半長度上限的摘要個別精簡，確保任兩份摘要都能放進同一次合併，
+        再依序分組合併；合併請求（含合併指示與提示語）的長度不超過 max_tokens。
+        LLM 回傳空白時沿用該組原本的摘要，不會遺失內容。
+
+        參數：
+        model: LLM 模型
+        summaries (list): 依時間順序排列的部分摘要
+        prompt (str): 使用者自訂的摘要提示語
+        fan_in (int): 每次合併的摘要數量上限
+        max_depth (int): 最多合併層數
+        max_tokens (int): 每次合併請求的長度上限（與 split_text 相同以字元數估算）
+        cancel_token (CancellationToken): 取消後不再送出新的合併請求
+        on_progress (callable): on_progress(stage, done, total)
+
+        回傳：
+        str: 合併後的會議記錄（超過層數上限時串接剩餘摘要）
+        """
+        fan_in = max(2, fan_in or Config.SUMMARY_REDUCE_FAN_IN)
+        max_depth = Config.SUMMARY_REDUCE_MAX_DEPTH if max_depth is None else max_depth
+        max_tokens = max_tokens or Config.SUMMARY_REDUCE_MAX_TOKENS
+        cancel_token = cancel_token or CancellationToken()
+
+        # 單份摘要的長度上限：扣除合併指示與提示語後的一半，任兩份都能一起合併
+        overhead = len(LLMTextSummarizer._merge_prompt(["", ""], prompt))
+        condense_limit = max(1, (max_tokens - overhead) // 2)
+
+        depth = 0
+        while len(summaries) > 1 and depth < max_depth:
+            stage = f"合併第 {depth + 1} 層"
+            oversized = [index for index, summary in enumerate(summaries) if len(summary) > condense_limit]
+            if oversized:
+                condensed = LLMTextSummarizer._run_parallel(
+                    lambda index: LLMTextSummarizer._condense(
+                        model, summaries[index], prompt, condense_limit, cancel_token
+                    ),
+                    oversized,
+                    LLMTextSummarizer._stage_progress(on_progress, f"{stage}：精簡過長摘要", len(oversized)),
+                    cancel_token
+                )
+                summaries = list(summaries)
+                for index, summary in zip(oversized, condensed):
+                    summaries[index] = summary
+
+            groups = LLMTextSummarizer._group_summaries(summaries, prompt, fan_in, max_tokens)
+            # 同一層的各組互不相依，可平行合併
+            merged = LLMTextSummarizer._run_parallel(
+                lambda group: LLMTextSummarizer._merge_group(model, group, prompt, cancel_token),
+                groups,
+                LLMTextSummarizer._stage_progress(on_progress, stage, len(groups)),
+                cancel_token
+            )
+            # 合併結果為空白時沿用該組原本的摘要
+            summaries = [
+                summary
+                for group, result in zip(groups, merged)
+                for summary in ([result] if result and result.strip() else group)
+            ]
+            depth += 1
+
+        return "\n".join(summaries)
+
+    @staticmethod
+    def _map_chunks(model, chunks, prompt, cancel_token, on_progress=None):
+        """對每個文本分段產生部分摘要（保留原始順序，略過空白回應）"""
+        responses = LLMTextSummarizer._run_parallel(
+            lambda chunk: LLMTextSummarizer.summarize_chunk(model, chunk, prompt, cancel_token),
+            chunks, LLMTextSummarizer._stage_progress(on_progress, "分段摘要", len(chunks)), cancel_token
+        )
+        return [response for response in responses if response]
+
+    @staticmethod
+    def _merge_group(model, group, prompt, cancel_token):
+        """合併一組部分摘要；只有一份時直接沿用"""
+        if len(group) == 1:
+            return group[0]
+        cancel_token.raise_if_cancelled()
+        return model.invoke(LLMTextSummarizer._merge_prompt(group, prompt), cancel_token=cancel_token)
+
+    @staticmethod
+    def _merge_prompt(group, prompt):
+        """組成合併請求的完整內容"""
+        context = "\n\n".join(
+            f"【第 {index} 部分】\n{summary}" for index, summary in enumerate(group, start=1)
+        )
+        return LLMTextSummarizer.MERGE_INSTRUCTION + prompt + "部分會議記錄：" + context
+
+    @staticmethod
+    def _condense(model, summary, prompt, limit, cancel_token):
+        """個別精簡過長的部分摘要；LLM 回傳空白時沿用原本的摘要"""
+        cancel_token.raise_if_cancelled()
+        condense_prompt = LLMTextSummarizer.CONDENSE_INSTRUCTION.format(limit=limit) + prompt + "部分會議記錄："
+        response = model.invoke(condense_prompt + summary, cancel_token=cancel_token)
+        return response if response and response.strip() else summary
+
+    @staticmethod
+    def _group_summaries(summaries, prompt, fan_in, max_tokens):
+        """
+        依序將摘要分組，每組不超過 fan_in 份，且合併請求的完整長度不超過 max_tokens
+
+        精簡後仍過長的摘要會單獨成為一組（原樣保留，不送出合併請求）
+        """
+        groups, group = [], []
+        for summary in summaries:
+            candidate = group + [summary]
+            fits = len(LLMTextSummarizer._merge_prompt(candidate, prompt)) <= max_tokens
+            if group and (len(group) >= fan_in or not fits):
+                groups.append(group)
+                candidate = [summary]
+            group = candidate
+        if group:
+            groups.append(group)
+        return groups
+
+    @staticmethod
+    def _stage_progress(on_progress, stage, total):
+        """將 on_progress(stage, done, total) 包裝成每完成一項呼叫一次的回呼"""
+        if on_progress is None:
+            return None
+        done = [0]
+
+        def advance():
+            done[0] += 1
+            on_progress(stage, done[0], total)
+        return advance
+
+    @staticmethod
+    def _run_parallel(func, items, on_item_done=None, cancel_token=None):
+        """
+        以執行緒池平行執行 LLM 呼叫，回傳結果順序與輸入相同
+
+        結果在呼叫端執行緒依序取回，等待期間定期檢查取消狀態（讓 Streamlit 能中止腳本）；
+        發生例外（包含取消）時放棄尚未開始的工作，不等待進行中的請求
+        """
+        cancel_token = cancel_token or CancellationToken()
+        max_workers = max(1, min(Config.SUMMARY_MAX_WORKERS, len(items)))
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [executor.submit(func, item) for item in items]
+            results = []
+            for future in futures:
+                results.append(cancel_token.result(future))
+                if on_item_done:
+                    on_item_done()
+            return results
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,46 @@
+import logging
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+# 🔹 **模型背景預載**
+class ModelPreloader:
+    """
+    登入後於背景執行緒預先匯入重量級模組並載入 Whisper 模型
+    - 整個伺服器行程只執行一次，所有 session 共用
+    - 預載失敗不影響使用者操作，實際使用時會再嘗試載入
+    """
+
+    _thread = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def start():
+        """啟動背景預載（已啟動過則略過）"""
+        if not Config.PRELOAD_MODELS_AFTER_LOGIN:
+            return
+        with ModelPreloader._lock:
+            if ModelPreloader._thread is not None:
+                return
+            ModelPreloader._thread = threading.Thread(
+                target=ModelPreloader._preload, name="model-preloader", daemon=True
+            )
+            ModelPreloader._thread.start()
+
+    @staticmethod
+    def _preload():
+        start = time.perf_counter()
+        try:
+            from models.audio_transcriber import AudioTranscriber
+            from models.llm_summarizer import LLMTextSummarizer
+
+            AudioTranscriber.load_model()    # whisper、torch 與模型權重
+            LLMTextSummarizer.get_router()   # langchain 與 Ollama 客戶端
+            import docxtpl  # noqa: F401  Word 匯出
+        except Exception as error:
+            logger.warning("模型預載失敗: %s", error)
+            return
+        logger.info("模型預載完成，耗時 %.1f 秒", time.perf_counter() - start)
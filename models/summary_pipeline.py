@@ -0,0 +1,99 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from models.cancellation import CancellationToken
+from models.document_generator import DocumentGenerator
+from models.llm_summarizer import LLMTextSummarizer
+
+
+# 🔹 **邊轉錄邊摘要**
+class SummaryPipeline:
+    """
+    轉錄與摘要管線化：逐字稿邊產生邊送入，分段一湊滿就立即送 LLM 摘要
+    - feed() 將文字放入有上限的佇列，佇列滿時轉錄端暫停等待（背壓）
+    - 背景執行緒依 split_text 的規則切分，每個分段完成即送出 LLM 請求
+    - close() 等待所有分段摘要完成，再依設定合併為最終結果
+    """
+
+    POLL_INTERVAL = 0.5  # 等待時檢查是否已取消的間隔（秒）
+
+    def __init__(self, prompt, cancel_token=None, mode=None, backends=None):
+        self.prompt = prompt
+        self.mode = mode
+        self.cancel_token = cancel_token or CancellationToken()
+        self._model = LLMTextSummarizer.get_router(backends)
+        self._queue = queue.Queue(maxsize=Config.PIPELINE_QUEUE_SIZE)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, Config.SUMMARY_MAX_WORKERS))
+        self._futures = []
+        self._error = None
+        self._closed = False
+        self._worker = threading.Thread(target=self._consume, name="summary-pipeline", daemon=True)
+        self._worker.start()
+
+    def feed(self, text):
+        """送入一段逐字稿文字；佇列已滿時等待，期間檢查是否已取消"""
+        while True:
+            self.cancel_token.poll()
+            if self._error is not None:
+                raise self._error
+            try:
+                self._queue.put(text, timeout=self.POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def close(self, on_progress=None):
+        """
+        結束輸入並取得最終摘要
+
+        參數:
+        - on_progress: on_progress(stage, done, total)，於呼叫端執行緒回報進度
+
+        回傳:
+        - 摘要結果字串
+        """
+        if not self._closed:
+            self.feed(None)  # None 表示輸入結束
+            self._closed = True
+        while self._worker.is_alive():
+            self.cancel_token.poll()
+            self._worker.join(self.POLL_INTERVAL)
+        if self._error is not None:
+            raise self._error
+
+        summaries = []
+        for done, future in enumerate(self._futures, start=1):
+            response = self.cancel_token.result(future)  # 等待期間檢查是否已取消，不等待進行中的請求
+            if response:
+                summaries.append(response)
+            if on_progress:
+                on_progress("分段摘要", done, len(self._futures))
+
+        return LLMTextSummarizer.reduce_summaries(
+            self._model, summaries, self.prompt, self.mode, self.cancel_token, on_progress
+        )
+
+    def _consume(self):
+        """背景執行緒：切分文字並在每個分段完成時送出摘要請求"""
+        try:
+            for chunk in DocumentGenerator.split_text_stream(self._iter_queue()):
+                self._futures.append(self._executor.submit(
+                    LLMTextSummarizer.summarize_chunk, self._model, chunk, self.prompt, self.cancel_token
+                ))
+        except BaseException as error:
+            self._error = error
+        finally:
+            # 已送出的請求仍可取得結果；取消時放棄尚未開始的請求
+            self._executor.shutdown(wait=False, cancel_futures=self.cancel_token.is_cancelled)
+
+    def _iter_queue(self):
+        while True:
+            try:
+                text = self._queue.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                self.cancel_token.raise_if_cancelled()
+                continue
+            if text is None:
+                return
+            yield text
@@ -0,0 +1,192 @@
+import html
+import math
+import re
+from config import Config
+
+
+# 🔹 **逐字稿前處理（減少送入 LLM 的 Token）**
+class TranscriptPreprocessor:
+    """
+    整理 Teams / Zoom 匯出的 VTT 逐字稿
+    - 移除標頭、NOTE/STYLE 區塊、Cue 編號與時間軸
+    - 移除 <v 發言者>、<c>、<b> 等標記，保留發言者名稱
+    - 刪除滾動字幕（rolling caption）重複出現的文字
+    - 合併同一位發言者連續的字幕
+    - 可選擇刪除語助詞（嗯、呃、um、uh…）
+    """
+
+    # 滾動字幕判斷：前後兩句時間相接或重疊，且重疊的詞數足夠多，才視為重複並刪除
+    ROLLING_MAX_GAP = 0.5       # 兩句之間最多相隔秒數
+    MIN_OVERLAP_TOKENS = 3      # 重疊至少這麼多詞（中文以字計），避免誤刪「對、對」等正常重複
+    MIN_OVERLAP_RATIO = 0.5     # 重疊至少佔前一句的比例，避免只因句尾與句首相同就刪除
+
+    VOICE_TAG = re.compile(r"<v(?:\.[\w.-]+)?\s+([^>]+)>")
+    MARKUP_TAG = re.compile(r"</?[^>]+>")
+    ZOOM_SPEAKER = re.compile(r"^([^:<>]{1,40}): (.+)$")  # Zoom 格式：「發言者: 內容」
+    TIMESTAMP = re.compile(r"(?:(\d+):)?(\d{1,2}):(\d{2})(?:[.,](\d{1,3}))?")
+    TOKEN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]|[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+
+    @staticmethod
+    def preprocess(vtt_text, drop_fillers=None):
+        """
+        將 VTT 內容整理為精簡的逐字稿
+
+        參數:
+        - vtt_text: VTT 檔案內容字串
+        - drop_fillers: 是否刪除語助詞（預設讀取 Config.TRANSCRIPT_DROP_FILLERS）
+
+        回傳:
+        - 每位發言者一行的逐字稿字串，格式為「發言者：內容」（無發言者時僅有內容）
+        """
+        if drop_fillers is None:
+            drop_fillers = Config.TRANSCRIPT_DROP_FILLERS
+
+        turns = []  # [(發言者, [字幕內容...])]
+        previous = {}  # 各發言者上一句字幕 (內容, 結束時間)，用於偵測滾動字幕
+
+        for speaker, cue_text, start, end in TranscriptPreprocessor.parse_cues(vtt_text):
+            previous_text, previous_end = previous.get(speaker, ("", None))
+            text = cue_text
+            if TranscriptPreprocessor.is_adjacent(previous_end, start):
+                text = TranscriptPreprocessor.remove_overlap(previous_text, cue_text)
+            previous[speaker] = (cue_text, end)
+            if not text:
+                continue
+
+            if drop_fillers:
+                text = TranscriptPreprocessor.drop_filler_words(text)
+                if not text:
+                    continue
+
+            if turns and turns[-1][0] == speaker:
+                turns[-1][1].append(text)
+            else:
+                turns.append((speaker, [text]))
+
+        return "\n".join(
+            f"{speaker}：{' '.join(texts)}" if speaker else " ".join(texts)
+            for speaker, texts in turns
+        )
+
+    @staticmethod
+    def parse_cues(vtt_text):
+        """
+        解析 VTT，依序回傳 (發言者, 字幕內容, 開始秒數, 結束秒數)；略過標頭、註解與樣式區塊
+
+        發言者以 <v> 標記為準；整份檔案沒有 <v> 標記，且多數字幕都以重複出現的「名稱: 」開頭時，
+        才視為 Zoom 格式，避免把「待辦事項: ...」之類的內容誤判為發言者
+        """
+        cues = []  # [(開始, 結束, [(<v> 發言者或 None, 文字)...])]
+        for block in re.split(r"\n\s*\n", vtt_text.replace("\r\n", "\n").replace("\r", "\n")):
+            lines = block.strip().split("\n")
+            timing_index = next((i for i, line in enumerate(lines) if "-->" in line), None)
+            if timing_index is None:
+                continue  # WEBVTT 標頭、NOTE、STYLE 等區塊
+
+            start, end = TranscriptPreprocessor.parse_timing(lines[timing_index])
+            texts = []
+            for line in lines[timing_index + 1:]:
+                voice = TranscriptPreprocessor.VOICE_TAG.search(line)
+                text = html.unescape(TranscriptPreprocessor.MARKUP_TAG.sub("", line)).strip()
+                if text or voice:
+                    texts.append((voice.group(1).strip() if voice else None, text))
+            cues.append((start, end, texts))
+
+        zoom_speakers = TranscriptPreprocessor.zoom_speakers(cues)
+        for start, end, texts in cues:
+            speaker, parts = None, []
+            for voice, text in texts:
+                if voice:
+                    speaker = voice
+                elif zoom_speakers:
+                    zoom = TranscriptPreprocessor.ZOOM_SPEAKER.match(text)
+                    if zoom and zoom.group(1).strip() in zoom_speakers:
+                        speaker, text = zoom.group(1).strip(), zoom.group(2).strip()
+                if text:
+                    parts.append(text)
+            if parts:
+                yield speaker, " ".join(parts), start, end
+
+    @staticmethod
+    def zoom_speakers(cues):
+        """回傳 Zoom 格式的發言者名稱集合；檔案含 <v> 標記或不符合 Zoom 格式時回傳空集合"""
+        if any(voice for _, _, texts in cues for voice, _ in texts):
+            return set()
+
+        prefixes = []
+        for _, _, texts in cues:
+            zoom = TranscriptPreprocessor.ZOOM_SPEAKER.match(texts[0][1]) if texts else None
+            if zoom:
+                prefixes.append(zoom.group(1).strip())
+
+        # 多數字幕都以「名稱: 」開頭，且有名稱重複出現（同一人說了不只一句），才是 Zoom 匯出的逐字稿
+        speakers = set(prefixes)
+        if prefixes and len(prefixes) * 2 >= len(cues) and len(speakers) < len(prefixes):
+            return speakers
+        return set()
+
+    @staticmethod
+    def parse_timing(line):
+        """解析時間軸「開始 --> 結束」，回傳 (開始秒數, 結束秒數)，無法解析時為 None"""
+        start_text, _, end_text = line.partition("-->")
+        return (
+            TranscriptPreprocessor.parse_timestamp(start_text),
+            TranscriptPreprocessor.parse_timestamp(end_text.strip().split(" ")[0]),
+        )
+
+    @staticmethod
+    def parse_timestamp(text):
+        """解析 HH:MM:SS.mmm、MM:SS.mmm 或 HH:MM:SS 格式的時間為秒數"""
+        match = TranscriptPreprocessor.TIMESTAMP.search(text)
+        if not match:
+            return None
+        hours, minutes, seconds, millis = match.groups()
+        return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int((millis or "0").ljust(3, "0")) / 1000
+
+    @staticmethod
+    def is_adjacent(previous_end, start):
+        """前一句與這一句在時間上重疊或相接（滾動字幕的特徵）"""
+        if previous_end is None or start is None:
+            return False
+        return start - previous_end <= TranscriptPreprocessor.ROLLING_MAX_GAP
+
+    @staticmethod
+    def remove_overlap(previous, current):
+        """
+        移除 current 開頭與 previous 結尾重疊的部分（滾動字幕會重複前一句）
+
+        以詞為單位比對（中文以字計），重疊需達 MIN_OVERLAP_TOKENS 個詞且佔前一句 MIN_OVERLAP_RATIO 以上，
+        不會切斷單字，也不會因句尾與下一句句首碰巧相同而刪除內容
+        """
+        previous_tokens = TranscriptPreprocessor.TOKEN.findall(previous)
+        current_matches = list(TranscriptPreprocessor.TOKEN.finditer(current))
+        current_tokens = [match.group() for match in current_matches]
+        minimum = max(
+            TranscriptPreprocessor.MIN_OVERLAP_TOKENS,
+            math.ceil(len(previous_tokens) * TranscriptPreprocessor.MIN_OVERLAP_RATIO)
+        )
+
+        for size in range(min(len(previous_tokens), len(current_tokens)), minimum - 1, -1):
+            if previous_tokens[-size:] == current_tokens[:size]:
+                if size == len(current_tokens):
+                    return ""
+                return current[current_matches[size].start():].strip()
+        return current
+
+    @staticmethod
+    def drop_filler_words(text):
+        """刪除語助詞及其後的標點"""
+        cjk_fillers = [word for word in Config.TRANSCRIPT_FILLER_WORDS if not word.isascii()]
+        ascii_fillers = [word for word in Config.TRANSCRIPT_FILLER_WORDS if word.isascii()]
+        if cjk_fillers:
+            text = re.sub(rf"(?:{'|'.join(map(re.escape, cjk_fillers))})+[，,、…~]*", "", text)
+        if ascii_fillers:
+            text = re.sub(
+                rf"\b(?:{'|'.join(map(re.escape, ascii_fillers))})\b[,.]*\s*", "", text, flags=re.IGNORECASE
+            )
+        return re.sub(r"\s{2,}", " ", text).strip()
+
+    @staticmethod
+    def estimate_tokens(text):
+        """粗估 Token 數：每個中日韓文字、每個英數詞、每個標點各算一個"""
+        return len(TranscriptPreprocessor.TOKEN.findall(text))
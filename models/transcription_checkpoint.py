@@ -0,0 +1,122 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+# 🔹 **轉錄進度存檔**
+class TranscriptionCheckpoint:
+    """
+    逐段保存轉錄結果，行程重啟或工作中斷後可從最後完成的區段繼續
+    - 以音檔內容雜湊（加上模型與區段長度）作為檔名，同一音檔重新上傳即可接續
+    - 每段完成後以暫存檔取代的方式寫入，避免寫到一半中斷造成檔案損壞
+    - 同一音檔同時只允許一個工作寫入存檔，其他工作照常轉錄但不讀寫存檔
+    - 超過保存期限（未再重試）的存檔會被清除
+    """
+
+    _active_keys = set()  # 目前持有存檔的工作（所有 session 共用）
+    _active_lock = threading.Lock()
+
+    def __init__(self, key):
+        self.key = key
+        self.path = os.path.join(Config.CHECKPOINT_FOLDER, f"{key}.json")
+        self.owned = False  # 是否持有此存檔；未持有時只保留在記憶體中
+        self.windows = []  # 已完成區段：{"segments": [...], "context": 下一段使用的上下文, "next_offset": 下一段起點}
+
+    @staticmethod
+    def key_for(audio_bytes):
+        """依音檔內容與轉錄設定產生存檔鍵值；設定不同時不會沿用舊進度"""
+        digest = hashlib.sha256(audio_bytes).hexdigest()
+        return f"{digest}_{Config.AUDIO_MODEL_TYPE}_{Config.WHISPER_WINDOW_SECONDS}"
+
+    def acquire(self):
+        """取得存檔的寫入權；其他工作正在轉錄同一音檔時回傳 False"""
+        with TranscriptionCheckpoint._active_lock:
+            if self.key in TranscriptionCheckpoint._active_keys:
+                return False
+            TranscriptionCheckpoint._active_keys.add(self.key)
+        self.owned = True
+        return True
+
+    def release(self):
+        """釋放存檔的寫入權（存檔保留，供之後重試接續）"""
+        if self.owned:
+            with TranscriptionCheckpoint._active_lock:
+                TranscriptionCheckpoint._active_keys.discard(self.key)
+            self.owned = False
+
+    @staticmethod
+    def prune(max_age_seconds=None):
+        """刪除超過保存期限的存檔與殘留暫存檔（略過進行中的工作）"""
+        if max_age_seconds is None:
+            max_age_seconds = Config.CHECKPOINT_MAX_AGE_DAYS * 86400
+        try:
+            names = os.listdir(Config.CHECKPOINT_FOLDER)
+        except OSError:
+            return
+        with TranscriptionCheckpoint._active_lock:
+            active = set(TranscriptionCheckpoint._active_keys)
+        now = time.time()
+        for name in names:
+            if name.split(".", 1)[0] in active:
+                continue
+            path = os.path.join(Config.CHECKPOINT_FOLDER, name)
+            try:
+                if now - os.path.getmtime(path) > max_age_seconds:
+                    os.remove(path)
+            except OSError as error:
+                logger.warning("刪除過期轉錄存檔失敗: %s", error)
+
+    def load(self):
+        """讀取已完成的區段，回傳完成數量（檔案不存在、損壞或未持有存檔時從頭開始）"""
+        if not self.owned:
+            self.windows = []
+            return 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                windows = json.load(f)["windows"]
+            self.windows = windows if all("next_offset" in window for window in windows) else []
+        except (OSError, ValueError, KeyError, TypeError):
+            self.windows = []
+        return len(self.windows)
+
+    def save_window(self, segments, context, next_offset):
+        """記錄新完成的區段與下一段的起點（取樣點）"""
+        self.windows.append({"segments": segments, "context": context, "next_offset": next_offset})
+        if not self.owned:
+            return
+        os.makedirs(Config.CHECKPOINT_FOLDER, exist_ok=True)
+        # 暫存檔名不重複，寫入完成後才取代正式存檔
+        fd, temp_path = tempfile.mkstemp(prefix=f"{self.key}.", suffix=".tmp", dir=Config.CHECKPOINT_FOLDER)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"windows": self.windows}, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @property
+    def segments(self):
+        return [segment for window in self.windows for segment in window["segments"]]
+
+    @property
+    def context(self):
+        return self.windows[-1]["context"] if self.windows else ""
+
+    @property
+    def next_offset(self):
+        return self.windows[-1]["next_offset"] if self.windows else 0
+
+    def clear(self):
+        """轉錄完成後刪除存檔"""
+        if self.owned and os.path.exists(self.path):
+            os.remove(self.path)
+        self.windows = []
@@ -1,9 +1,8 @@
 import streamlit as st
 import requests
 import json
-# from app import MeetingSummaryApp  # 導入主應用
-from controllers.meeting_controller import MeetingSummaryApp
 from config import Config
+from models.model_preloader import ModelPreloader
 
 # 🔹 **Streamlit 應用類**
 class StreamlitLoginApp:
@@ -56,6 +55,7 @@ class StreamlitLoginApp:
         if response_data and response_data.get("login", False):
             st.session_state["authenticated"] = True
             st.session_state["user_id"] = user_id
+            ModelPreloader.start()  # 登入後於背景預載模型
             st.rerun()  # 切換到主應用
         else:
             st.error("❌ 工號或密碼輸入錯誤！")
@@ -85,6 +85,10 @@ class StreamlitLoginApp:
 
     def display_main_app(self):
         """顯示主應用"""
+        # 延後匯入主應用（含 Whisper、LLM 等重量級模組），登入頁面不需載入
+        from controllers.meeting_controller import MeetingSummaryApp
+
+        ModelPreloader.start()  # 伺服器重啟後已登入的 session 也會觸發預載
         st.sidebar.button("登出", on_click=self.logout)
         MeetingSummaryApp().run()
 
@@ -0,0 +1,73 @@
+"""
+啟動效能分析：列出匯入各模組所花費的時間
+
+用法:
+    python startup_profile.py                    # 分析登入頁面（rag_engine）的匯入時間
+    python startup_profile.py controllers.meeting_controller --top 30
+
+使用 Python 內建的 -X importtime，在獨立行程中匯入指定模組，
+依累計時間排序列出最耗時的模組，可確認 whisper、torch、langchain 未在登入前載入。
+"""
+import argparse
+import subprocess
+import sys
+
+HEAVY_MODULES = ("whisper", "torch", "langchain", "langchain_community", "docxtpl")
+
+
+def profile_imports(module):
+    """在子行程中匯入模組，回傳 ([(模組名稱, 自身耗時 us, 累計耗時 us)], 錯誤訊息)；匯入成功時錯誤訊息為 None"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    records = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # 名稱前的縮排代表巢狀匯入層級，保留以區分最外層模組
+        records.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        return records, "\n".join(errors)
+    return records, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析模組匯入時間")
+    parser.add_argument("module", nargs="?", default="rag_engine", help="要分析的模組（預設 rag_engine）")
+    parser.add_argument("--top", type=int, default=20, help="列出最耗時的前幾個模組")
+    args = parser.parse_args()
+
+    records, error = profile_imports(args.module)
+    if error is not None:
+        # 匯入失敗時的耗時與模組清單不完整，不列出結果以免誤判為載入快速
+        print(f"❌ 匯入 {args.module} 失敗，無法分析：\n{error}", file=sys.stderr)
+        sys.exit(1)
+    if not records:
+        sys.exit(1)
+
+    # 最外層的模組名稱沒有縮排，其累計時間加總即為整體匯入時間
+    total_us = sum(cumulative for name, _, cumulative in records if name == name.lstrip())
+    print(f"匯入 {args.module} 共耗時 {total_us / 1e6:.2f} 秒，共 {len(records)} 個模組\n")
+
+    print(f"{'累計(ms)':>10} {'自身(ms)':>10}  模組")
+    for name, self_us, cumulative_us in sorted(records, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>10.1f} {self_us / 1000:>10.1f}  {name.strip()}")
+
+    loaded = {name.strip() for name, _, _ in records}
+    heavy = [
+        module for module in HEAVY_MODULES
+        if any(name == module or name.startswith(module + ".") for name in loaded)
+    ]
+    print()
+    if heavy:
+        print(f"⚠️ 已載入重量級模組: {', '.join(heavy)}")
+    else:
+        print("✅ 未載入重量級模組（whisper、torch、langchain、docxtpl）")
+
+
+if __name__ == "__main__":
+    main()